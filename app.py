@@ -1,14 +1,23 @@
 import os
-import re
 import io
 import logging
 import json
-from datetime import datetime
+import hashlib
+import sqlite3
+import time
+import threading
+import uuid
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
 
-from flask import Flask, render_template, request, send_file, redirect, url_for
+from flask import Flask, jsonify, render_template, request, send_file, redirect, url_for
 import yt_dlp
-import markdown
+import mistune
 import requests
+from requests.adapters import HTTPAdapter
 import openai
 from dotenv import load_dotenv
 
@@ -24,32 +33,96 @@ MOONSHOT_API_URL = "https://api.moonshot.cn/v1/"  # Replace with the actual KIMI
 client = openai.OpenAI(api_key=MOONSHOT_API_KEY, base_url=MOONSHOT_API_URL)
 models = ["moonshot-v1-8k", "moonshot-v1-32k", "moonshot-v1-128k"]
 
+# Markdown renderer for summaries, built once. Raw HTML is passed through as before.
+_MD = mistune.create_markdown(escape=False)
+
+# Shared session so small Moonshot API calls reuse keep-alive connections
+_HTTP = requests.Session()
+_HTTP.headers.update({"Authorization": f"Bearer {MOONSHOT_API_KEY}"})
+_HTTP.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+# Seconds to wait on the small Moonshot calls (balance, token count) before giving up
+MOONSHOT_HTTP_TIMEOUT = 10
+
+# Separate session for caption downloads, which must not carry the Moonshot API key
+_YT_HTTP = requests.Session()
+
+# Seconds to serve the last successful balance lookup before asking the API again
+BALANCE_TTL = 30
+# A failed lookup is remembered for a few seconds, so that during an outage concurrent
+# callers get the zero balance at once instead of each waiting out the timeout in turn
+BALANCE_FAILURE_TTL = 5
+_balance_cache = {"t": 0, "v": None, "ttl": BALANCE_TTL}
+_balance_lock = threading.Lock()
+
+# yt-dlp options for caption fetches; each thread reuses its own YoutubeDL built from these
+YDL_OPTS = {
+    'writeautomaticsub': True,
+    'skip_download': True,
+    'quiet': True,
+    'no_warnings': True,
+}
+_ydl_local = threading.local()
+
+# Summaries are generated by background workers; jobs live in this process only
+# and are forgotten JOB_TTL seconds after they finish
+EX = ThreadPoolExecutor(max_workers=8)
+JOBS = {}
+_jobs_lock = threading.Lock()
+JOB_TTL = 3600
+
+# Streamed summary deltas are passed on in batches of this many deltas, or
+# after this many seconds, rather than one per token
+STREAM_BATCH_SIZE = 5
+STREAM_BATCH_INTERVAL = 0.05
+
+# Summary history database, and the JSON file it replaced
+HISTORY_DB = 'summary_history.db'
+LEGACY_HISTORY_FILE = 'summary_history.json'
+# Seconds a request waits for another request's write to finish before failing
+HISTORY_DB_TIMEOUT = 30
+# Days a saved summary is reused for a repeat request of the same video and length
+SUMMARY_CACHE_DAYS = 7
+# History listing from the last page view, keyed by the database file's ETag
+_history_cache = {"etag": None, "v": None}
+
+# Local tokenizer used to pick a model without a round-trip to the API. The
+# encoding may have to be downloaded, so it is loaded in the background and the
+# API is used until it is ready (or for good, if tiktoken is not installed).
+_ENC = None
+
+def _load_encoding():
+    global _ENC
+    try:
+        import tiktoken
+        _ENC = tiktoken.get_encoding("cl100k_base")
+        logging.info("Local token estimation ready")
+    except Exception as e:
+        logging.warning(f"Local token estimation unavailable, using the API only: {str(e)}")
+
+threading.Thread(target=_load_encoding, name='load-tiktoken', daemon=True).start()
+
+# Model context limits, and how close (as a fraction) a local estimate may get
+# to one of them before the count is verified with the API
+TOKEN_LIMITS = [8000, 32000]
+TOKEN_ESTIMATE_MARGIN = 0.1
+
 def choose_model(messages):
     logging.info("Estimating token count for model selection")
-    # Use the Moonshot API to estimate token count
-    response = requests.post(
-        'https://api.moonshot.cn/v1/tokenizers/estimate-token-count',
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {MOONSHOT_API_KEY}"
-        },
-        json={
-            "model": "moonshot-v1-8k",
-            "messages": messages
-        }
-    )
+    token_count = None
+    enc = _ENC
+    if enc is not None:
+        token_count = sum(len(enc.encode(message["content"])) for message in messages)
+        logging.info(f"Local token estimate: {token_count}")
+        if any(abs(token_count - limit) < limit * TOKEN_ESTIMATE_MARGIN for limit in TOKEN_LIMITS):
+            logging.info("Local estimate is close to a model limit, verifying with API")
+            token_count = None
     
-    if response.status_code == 200:
-        token_count = response.json().get('data', {}).get('total_tokens', 0)
-        logging.info(f"Token count from API: {token_count}")
-    else:
-        # Fallback to a simple estimation if API call fails
-        token_count = len("".join([message["content"] for message in messages]).split()) * 1.3  # Rough estimate
-        logging.warning(f"Failed to get token count from API. Using fallback estimation: {token_count}")
+    if token_count is None:
+        token_count = count_tokens_api(messages)
     
-    if token_count <= 8000:
+    if token_count <= TOKEN_LIMITS[0]:
         model = models[0]  # moonshot-v1-8k
-    elif token_count <= 32000:
+    elif token_count <= TOKEN_LIMITS[1]:
         model = models[1]  # moonshot-v1-32k
     else:
         model = models[2]  # moonshot-v1-128k
@@ -57,79 +130,172 @@ def choose_model(messages):
     logging.info(f"Selected model: {model}")
     return model
 
+def count_tokens_api(messages):
+    # Use the Moonshot API to estimate token count
+    try:
+        response = _HTTP.post(
+            'https://api.moonshot.cn/v1/tokenizers/estimate-token-count',
+            json={
+                "model": "moonshot-v1-8k",
+                "messages": messages
+            },
+            timeout=MOONSHOT_HTTP_TIMEOUT
+        )
+    except requests.RequestException as e:
+        logging.warning(f"Token count request failed: {str(e)}")
+        response = None
+    
+    if response is not None and response.status_code == 200:
+        token_count = response.json().get('data', {}).get('total_tokens', 0)
+        logging.info(f"Token count from API: {token_count}")
+    else:
+        # Fallback to a simple estimation if API call fails
+        token_count = len("".join([message["content"] for message in messages]).split()) * 1.3  # Rough estimate
+        logging.warning(f"Failed to get token count from API. Using fallback estimation: {token_count}")
+    
+    return token_count
+
+def get_ydl():
+    # YoutubeDL is expensive to build but not thread-safe, so keep one per worker thread
+    ydl = getattr(_ydl_local, 'ydl', None)
+    if ydl is None:
+        ydl = _ydl_local.ydl = yt_dlp.YoutubeDL(YDL_OPTS)
+    return ydl
+
 def download_transcript(youtube_url):
     logging.info(f"Downloading transcript for URL: {youtube_url}")
-    ydl_opts = {
-        'writeautomaticsub': True,
-        'skip_download': True,
-        'outtmpl': 'transcript',
-    }
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(youtube_url, download=True)
-            video_title = info.get('title', 'Unknown Title')
-        
-        # Read the transcript
-        with open('transcript.en.vtt', 'r', encoding='utf-8') as f:
-            transcript = f.read()
-        
-        logging.info("Transcript downloaded successfully")
+        ydl = get_ydl()
+        info = ydl.extract_info(youtube_url, download=False)
+        video_title = info.get('title', 'Unknown Title')
         
-        # Clean the transcript
-        cleaned_transcript = clean_transcript(transcript)
+        # Fetch the captions directly, and only fall back to letting yt-dlp write them to disk
+        vtt_text = fetch_captions(info)
+        if vtt_text is not None:
+            logging.info("Transcript downloaded successfully")
+            cleaned_transcript = clean_transcript(vtt_text)
+        else:
+            logging.warning("Direct caption fetch failed, downloading with yt-dlp")
+            # Each download gets its own directory so concurrent jobs can't read each other's captions
+            with tempfile.TemporaryDirectory(prefix='podreader-') as tmpdir:
+                outtmpl = os.path.join(tmpdir, 'transcript')
+                with yt_dlp.YoutubeDL({**YDL_OPTS, 'outtmpl': outtmpl}) as fallback_ydl:
+                    fallback_ydl.extract_info(youtube_url, download=True)
+                logging.info("Transcript downloaded successfully")
+                cleaned_transcript = clean_transcript_stream(f"{outtmpl}.en.vtt")
         
-        with open('cleaned_transcript.txt', 'w', encoding='utf-8') as f:
-            f.write(cleaned_transcript)
+        # Keep a copy of the cleaned transcript for debugging
+        if app.debug:
+            with open('cleaned_transcript.txt', 'w', encoding='utf-8') as f:
+                f.write(cleaned_transcript)
         
-        logging.info("Transcript cleaned and saved")
+        logging.info("Transcript cleaned")
         return cleaned_transcript, video_title
     except Exception as e:
         logging.error(f"Error downloading transcript: {str(e)}")
         raise
 
-def clean_transcript(transcript):
-    logging.info("Cleaning transcript")
-    # Remove header
-    transcript = re.sub(r'^WEBVTT\n\n', '', transcript)
-    
-    # Remove timestamps and other non-relevant information
-    cleaned_transcript = re.sub(r'\d{2}:\d{2}:\d{2}\.\d{3} --> \d{2}:\d{2}:\d{2}\.\d{3}.*\n', '', transcript)
-    cleaned_transcript = re.sub(r'<[^>]+>', '', cleaned_transcript)
-    
-    # Remove alignment and position information
-    cleaned_transcript = re.sub(r'align:start position:0%\n', '', cleaned_transcript)
-    
-    # Remove extra newlines and leading/trailing whitespace
-    cleaned_transcript = re.sub(r'\n{3,}', '\n\n', cleaned_transcript)
-    cleaned_transcript = cleaned_transcript.strip()
-    
-    # Join lines that were split due to caption formatting
-    lines = cleaned_transcript.split('\n')
-    
-    unique_lines = []
-    i = 0
-    while i < len(lines)-1:
-        unique_lines.append(lines[i])
-        for j in range(1,3):
-            if not lines[i+j].startswith(lines[i]):
-                break
-        i += j
+def fetch_captions(info):
+    captions = info.get('automatic_captions', {}).get('en', [])
+    caption = next((c for c in captions if c.get('ext') == 'vtt'), None)
+    if caption is None:
+        # Nothing for yt-dlp to download either, so there is no point falling back
+        raise ValueError("No English auto-captions available for this video")
     
-    cleaned_transcript = '\n'.join(unique_lines)
-    # Remove multiple consecutive newlines
-    cleaned_transcript = re.sub(r'\n{2,}', '\n', cleaned_transcript)
+    try:
+        response = _YT_HTTP.get(caption['url'], timeout=15)
+    except requests.RequestException as e:
+        logging.warning(f"Failed to fetch captions: {str(e)}")
+        return None
+    if response.status_code != 200:
+        logging.warning(f"Failed to fetch captions. Status code: {response.status_code}")
+        return None
     
+    response.encoding = 'utf-8'
+    return response.text
+
+def is_timestamp(line):
+    # Cue timings look like "00:00:01.234 --> 00:00:05.678", optionally followed by settings
+    return (len(line) >= 29 and line[2] == ':' and line[5] == ':' and line[8] == '.'
+            and line[13:16] == '-->')
+
+def strip_tags(line):
+    # Remove inline "<...>" spans such as word timings and <c> styling tags.
+    # Walk the line once and join the text between tags at the end, rather than
+    # rebuilding the whole string for every tag.
+    start = line.find('<')
+    if start == -1:
+        return line
+    parts = []
+    pos = 0
+    while start != -1:
+        end = line.find('>', start + 1)
+        if end == -1:
+            break
+        parts.append(line[pos:start])
+        pos = end + 1
+        start = line.find('<', pos)
+    parts.append(line[pos:])
+    return ''.join(parts)
+
+def _clean_lines(lines):
+    """Yield the caption text of VTT lines, dropping everything else."""
+    prev = None
+    for line in lines:
+        # Remove header, timestamps and alignment/position information
+        if line.startswith('WEBVTT') or line.startswith('align:') or is_timestamp(line):
+            continue
+        
+        # Remove inline tags and surrounding whitespace
+        line = strip_tags(line).strip()
+        
+        # Join lines that were split due to caption formatting. Rolling captions
+        # repeat the previous line as a prefix of the next one, so keep a line only
+        # if it does not start with the last kept line. Blank lines are dropped.
+        if not line or (prev is not None and line.startswith(prev)):
+            continue
+        prev = line
+        yield line
+
+def clean_transcript(transcript):
+    logging.info("Cleaning transcript")
+    cleaned_transcript = '\n'.join(_clean_lines(transcript.split('\n')))
+    logging.info("Transcript cleaning completed")
+    return cleaned_transcript
+
+def clean_transcript_stream(path):
+    logging.info(f"Cleaning transcript from {path}")
+    with open(path, 'r', encoding='utf-8') as f:
+        cleaned_transcript = '\n'.join(_clean_lines(f))
     logging.info("Transcript cleaning completed")
     return cleaned_transcript
 
 def check_balance():
+    with _balance_lock:
+        now = time.monotonic()
+        if _balance_cache["v"] is not None and now - _balance_cache["t"] < _balance_cache["ttl"]:
+            return _balance_cache["v"]
+        
+        balance_info = _fetch_balance()
+        if balance_info is None:
+            balance_info = {
+                "available_balance": 0,
+                "voucher_balance": 0,
+                "cash_balance": 0
+            }
+            _balance_cache.update(t=time.monotonic(), v=balance_info, ttl=BALANCE_FAILURE_TTL)
+            return balance_info
+        
+        _balance_cache.update(t=now, v=balance_info, ttl=BALANCE_TTL)
+        return balance_info
+
+def _fetch_balance():
     logging.info("Checking balance")
-    response = requests.get(
-        'https://api.moonshot.cn/v1/users/me/balance',
-        headers={
-            "Authorization": f"Bearer {MOONSHOT_API_KEY}"
-        }
-    )
+    try:
+        response = _HTTP.get('https://api.moonshot.cn/v1/users/me/balance', timeout=MOONSHOT_HTTP_TIMEOUT)
+    except requests.RequestException as e:
+        logging.error(f"Failed to retrieve balance: {str(e)}")
+        return None
     
     if response.status_code == 200:
         balance_data = response.json().get('data', {})
@@ -139,7 +305,7 @@ def check_balance():
         logging.info(f"Balance retrieved: Available: {available_balance}, Voucher: {voucher_balance}, Cash: {cash_balance}")
     else:
         logging.error(f"Failed to retrieve balance. Status code: {response.status_code}")
-        available_balance = voucher_balance = cash_balance = 0
+        return None
     
     return {
         "available_balance": available_balance,
@@ -162,130 +328,315 @@ def generate_summary(transcript, reading_time, video_title):
     model = choose_model(messages)
     logging.info(f"Using model: {model}")
     
-    with open('promt.txt', 'w', encoding='utf-8') as f:
-        f.write(prompt)
+    # Keep a copy of the prompt for debugging
+    if app.debug:
+        with open('promt.txt', 'w', encoding='utf-8') as f:
+            f.write(prompt)
     try:
         completion = client.chat.completions.create(
             model=model,
             messages=messages,
             temperature=0.3,
+            stream=True,
         )
         
-        assistant_message = completion.choices[0].message
-        logging.info("Summary generated successfully")
-        return assistant_message.content
+        logging.info("Summary stream started")
+        deltas = (chunk.choices[0].delta.content or "" for chunk in completion if chunk.choices)
+        return batch_chunks(deltas)
     except Exception as e:
         logging.error(f"Error generating summary: {str(e)}")
         raise
 
-# Add this new function to save summaries
-def save_summary(youtube_url, reading_time, summary, video_title):
-    history_file = 'summary_history.json'
-    timestamp = datetime.now().isoformat()
-    summary_data = {
-        'youtube_url': youtube_url,
-        'video_title': video_title,
-        'reading_time': reading_time,
-        'summary': summary,
-        'timestamp': timestamp
-    }
+def batch_chunks(chunks, size=STREAM_BATCH_SIZE, interval=STREAM_BATCH_INTERVAL):
+    """Join streamed chunks into batches of ``size`` chunks or ``interval`` seconds, whichever comes first."""
+    buf = []
+    last = time.monotonic()
+    for chunk in chunks:
+        buf.append(chunk)
+        if len(buf) >= size or time.monotonic() - last > interval:
+            yield "".join(buf)
+            buf.clear()
+            last = time.monotonic()
+    if buf:
+        yield "".join(buf)
+
+class SummaryJob:
+    """Downloads a transcript and generates its summary on a background worker.
+
+    ``parts`` grows as summary text arrives so that /status can show progress.
+    ``html``, ``timestamp`` and ``error`` are only filled in once the job has finished.
+    """
     
-    if os.path.exists(history_file):
-        with open(history_file, 'r') as f:
-            history = json.load(f)
-    else:
-        history = []
+    def __init__(self, youtube_url, reading_time):
+        self.youtube_url = youtube_url
+        self.reading_time = reading_time
+        self.cache_key = summary_cache_key(youtube_url, reading_time)
+        self.stage = 'Downloading transcript'
+        self.video_title = None
+        self.transcript = None
+        self.parts = []
+        self.html = ''
+        self.timestamp = None
+        self.error = None
+        self.future = None
+        self.finished_at = None
     
-    history.append(summary_data)
+    @property
+    def text(self):
+        return ''.join(self.parts)
     
-    with open(history_file, 'w') as f:
-        json.dump(history, f, indent=2)
+    def run(self):
+        try:
+            self.transcript, self.video_title = download_transcript(self.youtube_url)
+            self.stage = 'Generating summary'
+            for chunk in generate_summary(self.transcript, self.reading_time, self.video_title):
+                self.parts.append(chunk)
+            logging.info("Summary generated successfully")
+            
+            # Save the summary
+            self.timestamp = save_summary(self.youtube_url, self.reading_time, self.text, self.video_title, self.transcript)
+            
+            # Convert summary to markdown
+            self.html = _MD(self.text)
+            logging.info("Request processed successfully")
+        except Exception as e:
+            logging.error(f"Error processing request: {str(e)}")
+            self.error = str(e)
+        finally:
+            self.finished_at = time.monotonic()
+
+def prune_jobs():
+    now = time.monotonic()
+    for job_id, job in list(JOBS.items()):
+        if job.finished_at is not None and now - job.finished_at > JOB_TTL:
+            JOBS.pop(job_id, None)
+
+def get_db():
+    conn = sqlite3.connect(HISTORY_DB, timeout=HISTORY_DB_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def init_db():
+    with closing(get_db()) as conn, conn:
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS summaries (
+                timestamp TEXT PRIMARY KEY,
+                youtube_url TEXT,
+                video_title TEXT,
+                reading_time INT,
+                summary TEXT,
+                transcript TEXT,
+                cache_key TEXT
+            )"""
+        )
+        
+        # Take the write lock first so two processes starting together don't both migrate the database
+        conn.execute("BEGIN IMMEDIATE")
+        
+        # Databases created by older versions lack the later columns
+        columns = [row['name'] for row in conn.execute("PRAGMA table_info(summaries)")]
+        if 'transcript' not in columns:
+            conn.execute("ALTER TABLE summaries ADD COLUMN transcript TEXT")
+        if 'cache_key' not in columns:
+            conn.execute("ALTER TABLE summaries ADD COLUMN cache_key TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS summaries_cache_key ON summaries (cache_key)")
+        
+        # Import the old JSON history once. user_version records that the import
+        # has run, so deleting every summary doesn't bring the old entries back.
+        if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+            if os.path.exists(LEGACY_HISTORY_FILE) and conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0] == 0:
+                with open(LEGACY_HISTORY_FILE, 'r') as f:
+                    legacy_history = json.load(f)
+                conn.executemany(
+                    "INSERT OR IGNORE INTO summaries (timestamp, youtube_url, video_title, reading_time, summary) "
+                    "VALUES (:timestamp, :youtube_url, :video_title, :reading_time, :summary)",
+                    legacy_history
+                )
+                logging.info(f"Imported {len(legacy_history)} summaries from {LEGACY_HISTORY_FILE}")
+            conn.execute("PRAGMA user_version = 1")
+
+def canonicalize_youtube_id(youtube_url):
+    # watch?v=, youtu.be/, shorts/ and embed/ links to the same video share one ID
+    youtube_url = youtube_url.strip()
+    parsed = urlparse(youtube_url)
+    host = parsed.netloc.lower()
+    path_parts = parsed.path.strip('/').split('/')
+    video_id = ''
+    if host.endswith('youtu.be'):
+        video_id = path_parts[0]
+    elif host.endswith('youtube.com'):
+        video_id = parse_qs(parsed.query).get('v', [''])[0]
+        if not video_id and len(path_parts) == 2 and path_parts[0] in ('shorts', 'embed', 'live', 'v'):
+            video_id = path_parts[1]
+    return video_id or youtube_url
+
+def summary_cache_key(youtube_url, reading_time):
+    return hashlib.sha1(f"{canonicalize_youtube_id(youtube_url)}|{reading_time}".encode()).hexdigest()
+
+def find_cached_summary(youtube_url, reading_time):
+    since = (datetime.now() - timedelta(days=SUMMARY_CACHE_DAYS)).isoformat()
+    with closing(get_db()) as conn:
+        return conn.execute(
+            "SELECT timestamp FROM summaries "
+            "WHERE cache_key = ? AND timestamp > ? ORDER BY timestamp DESC LIMIT 1",
+            (summary_cache_key(youtube_url, reading_time), since)
+        ).fetchone()
+
+# Add this new function to save summaries
+def save_summary(youtube_url, reading_time, summary, video_title, transcript):
+    timestamp = datetime.now().isoformat()
+    with closing(get_db()) as conn, conn:
+        conn.execute(
+            "INSERT INTO summaries (timestamp, youtube_url, video_title, reading_time, summary, transcript, cache_key) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (timestamp, youtube_url, video_title, reading_time, summary, transcript,
+             summary_cache_key(youtube_url, reading_time))
+        )
+    return timestamp
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
-    balance_info = check_balance()
-    
     if request.method == 'POST':
         youtube_url = request.form['youtube_url']
         reading_time = request.form['reading_time']
         
         logging.info(f"Processing request for URL: {youtube_url}, Reading time: {reading_time}")
         
-        try:
-            transcript, video_title = download_transcript(youtube_url)
-            summary = generate_summary(transcript, reading_time, video_title)
-            
-            # Save the summary
-            save_summary(youtube_url, reading_time, summary, video_title)
-            
-            # Convert summary to markdown
-            summary_html = markdown.markdown(summary)
-            
-            logging.info("Request processed successfully")
-            return render_template('result.html', summary_html=summary_html, transcript=transcript, video_title=video_title)
-        except Exception as e:
-            logging.error(f"Error processing request: {str(e)}")
-            return render_template('index.html', balance_info=balance_info, error=str(e))
+        # Reuse a recent summary of the same video and length instead of generating it again
+        cached = find_cached_summary(youtube_url, reading_time)
+        if cached is not None:
+            logging.info(f"Using cached summary from {cached['timestamp']}")
+            return redirect(url_for('view_summary', timestamp=cached['timestamp']))
+        
+        # Hand the work to a background worker and let the browser poll for the result.
+        # A job already running for the same video and length is shared rather than repeated.
+        job = SummaryJob(youtube_url, reading_time)
+        with _jobs_lock:
+            prune_jobs()
+            job_id = next((existing_id for existing_id, existing in JOBS.items()
+                           if existing.cache_key == job.cache_key and existing.finished_at is None), None)
+            if job_id is not None:
+                logging.info(f"Joining job {job_id} already running for this request")
+            else:
+                job_id = uuid.uuid4().hex
+                JOBS[job_id] = job
+                job.future = EX.submit(job.run)
+        return redirect(url_for('status', job_id=job_id))
     
+    balance_info = check_balance()
     return render_template('index.html', balance_info=balance_info)
 
+@app.route('/summary/<timestamp>')
+def view_summary(timestamp):
+    with closing(get_db()) as conn:
+        row = conn.execute("SELECT video_title, summary FROM summaries WHERE timestamp = ?", (timestamp,)).fetchone()
+    if row is None:
+        return "Summary not found", 404
+    return render_template('result.html', summary_html=_MD(row['summary']), timestamp=timestamp, video_title=row['video_title'])
+
+@app.route('/status/<job_id>')
+def status(job_id):
+    job = JOBS.get(job_id)
+    if job is None:
+        return "Job not found", 404
+    
+    if job.finished_at is None:
+        # Snapshot the parts so the page and the stream agree on where to resume
+        parts = list(job.parts)
+        return render_template('status.html', job=job, job_id=job_id, text=''.join(parts), sent=len(parts))
+    if job.error:
+        return render_template('index.html', balance_info=check_balance(), error=job.error)
+    return render_template('result.html', summary_html=job.html, timestamp=job.timestamp, video_title=job.video_title)
+
+@app.route('/status/<job_id>/progress')
+def status_progress(job_id):
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify(error="Job not found"), 404
+    
+    # Only send the parts the page doesn't have yet. Read finished_at first:
+    # every part is appended before it is set, so "done" never hides text.
+    start = request.args.get('from', '0')
+    sent = int(start) if start.isdigit() else 0
+    done = job.finished_at is not None
+    parts = job.parts[sent:]
+    return jsonify(
+        stage=job.stage,
+        video_title=job.video_title,
+        text=''.join(parts),
+        next=sent + len(parts),
+        done=done
+    )
+
+def history_etag():
+    # SQLite bumps the file change counter (header bytes 24-27) on every committed
+    # write, including deletes that leave the file size unchanged. The inode tells
+    # a recreated database apart from the old one.
+    with open(HISTORY_DB, 'rb') as f:
+        f.seek(24)
+        change_counter = int.from_bytes(f.read(4), 'big')
+        inode = os.fstat(f.fileno()).st_ino
+    return f'W/"{inode:x}-{change_counter:x}"'
+
 # Add a new route for the history page
 @app.route('/history')
 def history():
-    history_file = 'summary_history.json'
-    if os.path.exists(history_file):
-        with open(history_file, 'r') as f:
-            history = json.load(f)
-    else:
-        history = []
+    etag = history_etag()
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304, {'ETag': etag}
+    
+    history = _history_cache["v"]
+    if _history_cache["etag"] != etag:
+        # The listing only needs metadata, so leave the summaries themselves in the database
+        with closing(get_db()) as conn:
+            rows = conn.execute(
+                "SELECT timestamp, youtube_url, video_title, reading_time FROM summaries ORDER BY timestamp DESC"
+            ).fetchall()
+        history = [dict(row) for row in rows]
+        _history_cache.update(etag=etag, v=history)
     
-    return render_template('history.html', history=history)
+    response = app.make_response(render_template('history.html', history=history))
+    # Let the browser keep the page, but make it check the ETag on every view
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 # Add a new route to delete a summary
 @app.route('/delete/<timestamp>')
 def delete_summary(timestamp):
-    history_file = 'summary_history.json'
-    if os.path.exists(history_file):
-        with open(history_file, 'r') as f:
-            history = json.load(f)
-        
-        history = [item for item in history if item['timestamp'] != timestamp]
-        
-        with open(history_file, 'w') as f:
-            json.dump(history, f, indent=2)
+    with closing(get_db()) as conn, conn:
+        conn.execute("DELETE FROM summaries WHERE timestamp = ?", (timestamp,))
     
     return redirect(url_for('history'))
 
-# Modify the download route to handle history downloads
+# Columns of the summaries table that can be downloaded, by file type
+DOWNLOAD_COLUMNS = {
+    'summary': 'summary',
+    'transcript': 'transcript',
+}
+
 @app.route('/download/<file_type>')
 def download(file_type):
     logging.info(f"Downloading {file_type}")
-    if file_type == 'summary':
-        content = request.args.get('content')
-        filename = 'summary.md'
-    elif file_type == 'transcript':
-        content = request.args.get('content')
-        filename = 'transcript.md'
-    elif file_type == 'history_summary':
-        timestamp = request.args.get('timestamp')
-        history_file = 'summary_history.json'
-        if os.path.exists(history_file):
-            with open(history_file, 'r') as f:
-                history = json.load(f)
-            summary_data = next((item for item in history if item['timestamp'] == timestamp), None)
-            if summary_data:
-                content = summary_data['summary']
-                filename = f"summary_{timestamp}.md"
-            else:
-                return "Summary not found", 404
-    else:
+    column = DOWNLOAD_COLUMNS.get(file_type)
+    if column is None:
         logging.error(f"Invalid file type: {file_type}")
         return "Invalid file type", 400
     
+    timestamp = request.args.get('timestamp')
+    with closing(get_db()) as conn:
+        row = conn.execute(f"SELECT {column} FROM summaries WHERE timestamp = ?", (timestamp,)).fetchone()
+    if row is None or row[column] is None:
+        return f"{file_type.capitalize()} not found", 404
+    content = row[column]
+    filename = f"{file_type}_{timestamp}.md"
+    
     buffer = io.BytesIO(content.encode('utf-8'))
     buffer.seek(0)
     logging.info(f"File {filename} prepared for download")
     return send_file(buffer, as_attachment=True, download_name=filename, mimetype='text/markdown')
 
+init_db()
+
 if __name__ == '__main__':
     app.run(debug=True)